@@ -0,0 +1,547 @@
+import csv
+import json
+import math
+import os
+import re
+import numpy as np
+
+# 两份馆藏导出文件（位于项目根目录）
+PROCESSED_FILE = "Processed_Data.csv"
+MET_FILE = "blue and white porcelain - met_blue_and_white_china.csv"
+
+# 列式存储的输出目录：每一列一个 .npy 文件，另有 meta.json 记录类别字典
+STORE_DIR = os.path.join("data", "catalogue")
+# 存储格式版本：解析规则或列定义变化时递增，读取方据此判断已有存储是否需要重建
+STORE_VERSION = 3
+
+# 来源标记
+SOURCE_PROCESSED = "processed"
+SOURCE_MET = "met"
+
+# 单位换算到厘米
+UNIT_TO_CM = {
+    'millimetres': 0.1,
+    'mm': 0.1,
+    'centimetres': 1.0,
+    'cm': 1.0,
+    'metres': 100.0,
+    'inches': 2.54,
+    'in': 2.54,
+}
+
+# 类别列：在存储中保存为整数编码，字典写入 meta.json
+CATEGORY_COLUMNS = ['source', 'period', 'type']
+# 文本列：保存为定长 unicode 数组
+TEXT_COLUMNS = ['object_number', 'date', 'element', 'url']
+# 数值列
+NUMERIC_COLUMNS = {
+    'id': np.int32,
+    'height_cm': np.float32,
+    'diameter_cm': np.float32,
+    'year_start': np.int16,
+    'year_end': np.int16,
+}
+
+# 缺失年份使用的哨兵值（int16 无法表示 NaN）
+MISSING_YEAR = -1
+# 没有 Processed_Data.csv id 的记录（Met 导出的记录、id 无法解析的行）
+MISSING_ID = -1
+
+# BM 风格尺寸："Height: 5.80 centimetres"、"Diameter: 155 millimetres"
+_BM_DIMENSION_RE = re.compile(
+    r'(Height|Hight|Diameter|iameter)\s*:\s*(\d+(?:\.\d+)?)\s*(millimetres|centimetres|metres|inches|mm|cm)',
+    re.IGNORECASE,
+)
+# 仅有数值和单位的高度（例如 "25.50 centimetres"）
+_BARE_DIMENSION_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(millimetres|centimetres|metres|inches|mm|cm)\s*$')
+# 单位词（用于识别 "156 cm millimetres" 这类单位重复的可疑字段）
+_UNIT_TOKEN_RE = re.compile(r'\b(millimetres|centimetres|metres|inches|mm|cm)\b', re.IGNORECASE)
+# Met 风格尺寸中的括号厘米值："H. 1 3/4 in. (4.4 cm)"
+_MET_CM_RE = re.compile(r'\((\d+(?:\.\d+)?)\s*cm\)')
+
+# 年代中的四位年份区间："1426-1435"、"1620–30"
+_YEAR_RANGE_RE = re.compile(r'(\d{4})\s*[-–]\s*(\d{2,4})')
+_YEAR_RE = re.compile(r'\b(\d{4})\b')
+_DECADE_RE = re.compile(r'(\d{4})s')
+# 世纪表达："16thC"、"18th century"
+_CENTURY_RE = re.compile(r'(\d{1,2})(?:st|nd|rd|th)\s*(?:C\b|century)?', re.IGNORECASE)
+
+# 朝代标准写法
+_PERIOD_NAMES = ['Yuan dynasty', 'Ming dynasty', 'Qing dynasty']
+# 年号/时期补充（Met 导出缺少括号，如 "Ming dynastyZhengde"）
+_REIGN_RE = re.compile(r'dynasty\s*\(?\s*([A-Z][a-z]+)\s*\)?')
+
+# 器型名称归一化
+_TYPE_ALIASES = {
+    'ceramics': '',
+}
+
+
+def _to_cm(value, unit):
+    """将数值按单位换算为厘米"""
+    return round(float(value) * UNIT_TO_CM[unit.lower()], 2)
+
+
+def _height_candidate(text):
+    """
+    从单个字段中解析高度（厘米），返回 (高度, 是否可疑)
+    字段中出现多个单位词（如 "Height: 156 cm millimetres"）时视为可疑
+    """
+    text = (text or '').strip()
+    if not text or text == '-1':
+        return float('nan'), False
+
+    suspicious = len(_UNIT_TOKEN_RE.findall(text)) > 1
+    for label, value, unit in _BM_DIMENSION_RE.findall(text):
+        if label.lower() in ('height', 'hight'):
+            return _to_cm(value, unit), suspicious
+    bare = _BARE_DIMENSION_RE.match(text)
+    if bare:
+        return _to_cm(bare.group(1), bare.group(2)), suspicious
+    return float('nan'), suspicious
+
+
+def heights_disagree(column_cm, size_cm):
+    """Height 列与 Size 列中的高度是否不一致（两者都有值时才比较）"""
+    if math.isnan(column_cm) or math.isnan(size_cm):
+        return False
+    return not math.isclose(column_cm, size_cm, rel_tol=0.01, abs_tol=0.05)
+
+
+def parse_height_cm(height_text, size_text=''):
+    """
+    解析高度（厘米）
+    优先使用 Height 列；若 Height 列含多个单位词或与 Size 列中的高度不一致，改用 Size 列
+    支持 "Height: 84 millimetres"、"25.50 centimetres"、"H. 1 3/4 in. (4.4 cm)"
+    无法解析时返回 NaN
+    """
+    size_text = (size_text or '').strip()
+    column_cm, suspicious = _height_candidate(height_text)
+    size_cm, _ = _height_candidate(size_text)
+
+    if not math.isnan(size_cm) and (
+            math.isnan(column_cm) or suspicious or heights_disagree(column_cm, size_cm)):
+        return size_cm
+    if not math.isnan(column_cm):
+        return column_cm
+
+    # Met 风格：各尺寸以分号分隔，取第一个 "H." 段中的厘米值
+    for segment in size_text.split(';'):
+        segment = segment.strip()
+        if segment.startswith('Each:'):
+            segment = segment[len('Each:'):].strip()
+        if segment.startswith('H.'):
+            match = _MET_CM_RE.search(segment)
+            if match:
+                return float(match.group(1))
+
+    return float('nan')
+
+
+def find_height_conflicts(processed_file=PROCESSED_FILE, met_file=MET_FILE):
+    """
+    列出 Height 列与 Size 列高度不一致或 Height 列可疑的记录
+    返回 [(馆藏编号, Height 列原文, Size 列原文, 采用的高度)]
+    """
+    conflicts = []
+    for file_path in (processed_file, met_file):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                column_cm, suspicious = _height_candidate(row.get('Height', ''))
+                size_cm, _ = _height_candidate(row.get('Size', ''))
+                if suspicious or heights_disagree(column_cm, size_cm):
+                    conflicts.append((
+                        (row.get('Object Number') or '').strip(),
+                        (row.get('Height') or '').strip(),
+                        (row.get('Size') or '').strip(),
+                        parse_height_cm(row.get('Height', ''), row.get('Size', '')),
+                    ))
+    return conflicts
+
+
+def parse_diameter_cm(size_text):
+    """
+    解析直径（厘米），只取器物主直径，忽略口径/足径（"Diam. of rim"、"Diam. of foot"）
+    无法解析时返回 NaN
+    """
+    size_text = (size_text or '').strip()
+    if not size_text:
+        return float('nan')
+
+    for label, value, unit in _BM_DIMENSION_RE.findall(size_text):
+        if label.lower() in ('diameter', 'iameter'):
+            return _to_cm(value, unit)
+
+    for segment in size_text.split(';'):
+        segment = segment.strip()
+        if segment.startswith('Diam.') and not re.match(r'Diam\.?\s*(of|\()', segment):
+            match = _MET_CM_RE.search(segment)
+            if match:
+                return float(match.group(1))
+
+    return float('nan')
+
+
+def _century_range(century, qualifier=''):
+    """
+    将世纪转换为年份区间，例如 16 -> (1500, 1599)
+    qualifier 支持 early / mid / late / first half / second quarter 等限定词
+    """
+    start = (century - 1) * 100
+    qualifier = qualifier.lower()
+    if 'first quarter' in qualifier:
+        return start, start + 24
+    if 'second quarter' in qualifier:
+        return start + 25, start + 49
+    if 'third quarter' in qualifier:
+        return start + 50, start + 74
+    if 'fourth quarter' in qualifier:
+        return start + 75, start + 99
+    if 'first half' in qualifier:
+        return start, start + 49
+    if 'second half' in qualifier:
+        return start + 50, start + 99
+    if 'early' in qualifier:
+        return start, start + 32
+    if 'mid' in qualifier:
+        return start + 33, start + 66
+    if 'late' in qualifier:
+        return start + 67, start + 99
+    return start, start + 99
+
+
+def parse_year_range(date_text):
+    """
+    解析年代为 (起始年, 结束年)，无法解析时返回 (MISSING_YEAR, MISSING_YEAR)
+    支持 "1621"、"1426-1435"、"1661 (dated)"、"16thC-17thC"、"15thC(early)"、
+    "late 16th–17th century"、"ca. 1620–30"、
+    "Ming dynasty (1368–1644), Wanli mark and period (1573–1620) / China"
+    """
+    text = (date_text or '').strip()
+    if not text:
+        return MISSING_YEAR, MISSING_YEAR
+
+    # 多个括号区间时取最后一个（最具体的年号区间）
+    ranges = _YEAR_RANGE_RE.findall(text)
+    if ranges:
+        start, end = ranges[-1]
+        start = int(start)
+        # "1620–30" 这类缩写结尾补全世纪
+        if len(end) == 2:
+            end = int(str(start)[:2] + end)
+        else:
+            end = int(end)
+        return start, end
+
+    decades = _DECADE_RE.findall(text)
+    if decades:
+        return int(decades[0]), int(decades[-1]) + 9
+
+    years = _YEAR_RE.findall(text)
+    if years:
+        return int(years[0]), int(years[-1])
+
+    # 世纪表达，可能是区间（"16thC-17thC"、"late 16th–early 17th century"）
+    parts = re.split(r'\s*[-–]\s*', text.replace('mid-', 'mid '))
+    centuries = []
+    for part in parts:
+        match = _CENTURY_RE.search(part)
+        if match:
+            qualifier = part[:match.start()] + part[match.end():]
+            centuries.append(_century_range(int(match.group(1)), qualifier))
+    if centuries:
+        return centuries[0][0], centuries[-1][1]
+
+    return MISSING_YEAR, MISSING_YEAR
+
+
+def normalize_period(period_text, date_text=''):
+    """
+    归一化朝代名称：统一大小写，补全年号括号
+    "Ming Dynasty" -> "Ming dynasty"，"Qing dynastyKangxi" -> "Qing dynasty (Kangxi)"
+    Periods 为空时尝试从年代字符串中识别（Met 导出的 "Qing dynasty (1644–1911) / China"）
+    """
+    text = (period_text or '').strip()
+    if not text:
+        date_text = (date_text or '').strip()
+        for name in _PERIOD_NAMES:
+            if date_text.lower().startswith(name.lower()):
+                return name
+        return ''
+
+    found = [name for name in _PERIOD_NAMES if name.lower() in text.lower()]
+    if len(found) > 1:
+        return ' / '.join(found)
+    if not found:
+        return text
+
+    reign = _REIGN_RE.search(text)
+    if reign:
+        return f"{found[0]} ({reign.group(1)})"
+    return found[0]
+
+
+def normalize_type(type_text):
+    """归一化器型：小写、空格替换为连字符，泛化类别（如 "Ceramics"）视为未知"""
+    text = (type_text or '').strip().lower().replace(' ', '-')
+    return _TYPE_ALIASES.get(text, text)
+
+
+def parse_row(row, source):
+    """
+    将一行原始 CSV 记录解析为类型化字典
+    id 只取自 Processed_Data.csv（color.csv 与网站使用的编号）；Met 导出自带的 id
+    是另一套从 1 开始的编号，会与之冲突，因此 Met 记录的 id 记为 MISSING_ID
+    """
+    year_start, year_end = parse_year_range(row.get('Date', ''))
+    item_id = MISSING_ID
+    if source == SOURCE_PROCESSED:
+        try:
+            item_id = int((row.get('id') or '').strip())
+        except ValueError:
+            pass
+
+    return {
+        'id': item_id,
+        'source': source,
+        'object_number': (row.get('Object Number') or '').strip(),
+        'date': (row.get('Date') or '').strip(),
+        'year_start': year_start,
+        'year_end': year_end,
+        'height_cm': parse_height_cm(row.get('Height', ''), row.get('Size', '')),
+        'diameter_cm': parse_diameter_cm(row.get('Size', '')),
+        'period': normalize_period(row.get('Periods', ''), row.get('Date', '')),
+        'type': normalize_type(row.get('type', '')),
+        'element': (row.get('Element') or '').strip(),
+        'url': (row.get('URL') or '').strip(),
+    }
+
+
+def load_merged_records(processed_file=PROCESSED_FILE, met_file=MET_FILE):
+    """
+    读取并合并两份导出
+    以 Processed_Data.csv 为准；Met 导出中馆藏编号已出现的记录跳过，
+    没有馆藏编号的行（分页标记等）丢弃
+    合并结果中 id 只标识 Processed_Data.csv 记录，Met 记录（id 为 MISSING_ID）以 object_number 标识
+    """
+    records = []
+    seen = set()
+
+    with open(processed_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            record = parse_row(row, SOURCE_PROCESSED)
+            records.append(record)
+            seen.add(record['object_number'])
+
+    with open(met_file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            object_number = (row.get('Object Number') or '').strip()
+            if not object_number or object_number in seen:
+                continue
+            records.append(parse_row(row, SOURCE_MET))
+            seen.add(object_number)
+
+    return records
+
+
+class CatalogueStore:
+    """
+    类型化列式馆藏存储
+    columns 为 列名 -> numpy 数组；类别列保存整数编码，categories 为 列名 -> 取值列表
+    id 列不是全表主键：Met 来源的记录 id 为 MISSING_ID，需用 object_number 区分
+    """
+
+    def __init__(self, columns, categories, version=STORE_VERSION):
+        self.columns = columns
+        self.categories = categories
+        self.version = version
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_records(cls, records):
+        """由解析后的记录列表构建存储"""
+        columns = {}
+        categories = {}
+
+        for name, dtype in NUMERIC_COLUMNS.items():
+            columns[name] = np.array([r[name] for r in records], dtype=dtype)
+
+        for name in TEXT_COLUMNS:
+            columns[name] = np.array([r[name] for r in records], dtype=str)
+
+        for name in CATEGORY_COLUMNS:
+            values = [r[name] for r in records]
+            # 空字符串固定编码为 0，便于过滤缺失值
+            labels = [''] + sorted(set(values) - {''})
+            lookup = {label: code for code, label in enumerate(labels)}
+            columns[name] = np.array([lookup[v] for v in values], dtype=np.int16)
+            categories[name] = labels
+
+        return cls(columns, categories)
+
+    def save(self, store_dir=STORE_DIR):
+        """每列写入一个 .npy 文件，类别字典与列信息写入 meta.json"""
+        os.makedirs(store_dir, exist_ok=True)
+        for name, array in self.columns.items():
+            np.save(os.path.join(store_dir, f"{name}.npy"), array)
+
+        meta = {
+            'version': self.version,
+            'rows': len(self),
+            'columns': {name: str(array.dtype) for name, array in self.columns.items()},
+            'categories': self.categories,
+        }
+        with open(os.path.join(store_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, store_dir=STORE_DIR, mmap=True):
+        """加载存储；mmap=True 时各列以只读内存映射方式打开，version 取自 meta.json"""
+        with open(os.path.join(store_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        mmap_mode = 'r' if mmap else None
+        columns = {
+            name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in meta['columns']
+        }
+        # 版本号出现之前写入的存储视为版本 1
+        return cls(columns, meta['categories'], meta.get('version', 1))
+
+    def code(self, column, label):
+        """类别标签 -> 整数编码，标签不存在时返回 -1（不匹配任何行）"""
+        try:
+            return self.categories[column].index(label)
+        except ValueError:
+            return -1
+
+    def labels(self, column, mask=None):
+        """返回类别列的标签数组（可选按掩码过滤）"""
+        codes = self.columns[column] if mask is None else self.columns[column][mask]
+        return np.asarray(self.categories[column], dtype=object)[codes]
+
+    def mask(self, period=None, type=None, source=None,
+             year_from=None, year_to=None, min_height=None, max_height=None):
+        """
+        构建向量化过滤掩码，所有条件取交集
+        年份条件按区间重叠判断；高度条件会排除缺失高度的记录
+        """
+        result = np.ones(len(self), dtype=bool)
+
+        for column, label in (('period', period), ('type', type), ('source', source)):
+            if label is not None:
+                result &= self.columns[column] == self.code(column, label)
+
+        if year_from is not None or year_to is not None:
+            has_year = self.columns['year_start'] != MISSING_YEAR
+            result &= has_year
+            if year_from is not None:
+                result &= self.columns['year_end'] >= year_from
+            if year_to is not None:
+                result &= self.columns['year_start'] <= year_to
+
+        if min_height is not None:
+            result &= self.columns['height_cm'] >= min_height
+        if max_height is not None:
+            result &= self.columns['height_cm'] <= max_height
+
+        return result
+
+    def group_count(self, column, mask=None):
+        """
+        按类别列分组计数，返回 {标签: 数量}（按数量降序，忽略空标签）
+        """
+        codes = self.columns[column] if mask is None else self.columns[column][mask]
+        counts = np.bincount(codes, minlength=len(self.categories[column]))
+        order = np.argsort(-counts, kind='stable')
+        return {
+            self.categories[column][code]: int(counts[code])
+            for code in order
+            if code != 0 and counts[code] > 0
+        }
+
+    def group_by(self, key_column, value_column, mask=None):
+        """
+        按类别列分组统计数值列，返回 {标签: {'count', 'mean', 'min', 'max'}}，忽略 NaN
+        """
+        keys = self.columns[key_column]
+        values = np.asarray(self.columns[value_column], dtype=np.float64)
+        valid = ~np.isnan(values)
+        if mask is not None:
+            valid &= mask
+        keys = keys[valid]
+        values = values[valid]
+
+        size = len(self.categories[key_column])
+        counts = np.bincount(keys, minlength=size)
+        sums = np.bincount(keys, weights=values, minlength=size)
+        mins = np.full(size, np.inf)
+        maxs = np.full(size, -np.inf)
+        np.minimum.at(mins, keys, values)
+        np.maximum.at(maxs, keys, values)
+
+        result = {}
+        for code in np.nonzero(counts)[0]:
+            if code == 0:
+                continue
+            result[self.categories[key_column][code]] = {
+                'count': int(counts[code]),
+                'mean': round(float(sums[code] / counts[code]), 2),
+                'min': round(float(mins[code]), 2),
+                'max': round(float(maxs[code]), 2),
+            }
+        return result
+
+    def year_bins(self, mask=None):
+        """按世纪统计起始年份，与 analysis_data.json 的 year_bins 格式一致（"1400s": n）"""
+        starts = self.columns['year_start']
+        valid = starts != MISSING_YEAR
+        if mask is not None:
+            valid &= mask
+        centuries, counts = np.unique((starts[valid] // 100) * 100, return_counts=True)
+        return {f"{int(c)}s": int(n) for c, n in zip(centuries, counts)}
+
+    def height_bins(self, mask=None):
+        """按高度区间统计，与 analysis_data.json 的 height_bins 区间一致"""
+        heights = np.asarray(self.columns['height_cm'], dtype=np.float64)
+        valid = ~np.isnan(heights)
+        if mask is not None:
+            valid &= mask
+        edges = [5, 10, 20, 30, 50]
+        labels = ['0-5cm', '5-10cm', '10-20cm', '20-30cm', '30-50cm', '50cm+']
+        counts = np.bincount(np.digitize(heights[valid], edges), minlength=len(labels))
+        return {label: int(n) for label, n in zip(labels, counts) if n > 0}
+
+
+def build_store(processed_file=PROCESSED_FILE, met_file=MET_FILE, store_dir=STORE_DIR):
+    """解析两份导出并写入列式存储"""
+    records = load_merged_records(processed_file, met_file)
+    store = CatalogueStore.from_records(records)
+    store.save(store_dir)
+    return store
+
+
+if __name__ == "__main__":
+    import sys
+
+    store_dir = sys.argv[1] if len(sys.argv) > 1 else STORE_DIR
+    store = build_store(store_dir=store_dir)
+
+    print(f"已写入 {len(store)} 条记录到 {store_dir}")
+    print(f"来源: {store.group_count('source')}")
+    print(f"缺失高度: {int(np.isnan(store['height_cm']).sum())} 条")
+    print(f"缺失年份: {int((store['year_start'] == MISSING_YEAR).sum())} 条")
+    print(f"朝代: {store.group_count('period')}")
+    print(f"年代分布: {store.year_bins()}")
+    print(f"高度分布: {store.height_bins()}")
+
+    conflicts = find_height_conflicts()
+    if conflicts:
+        print(f"\nHeight 列与 Size 列高度不一致 {len(conflicts)} 条：")
+        for object_number, height_text, size_text, height_cm in conflicts:
+            print(f"  {object_number}: Height={height_text!r} Size={size_text!r} -> 采用 {height_cm} cm")
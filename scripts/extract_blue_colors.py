@@ -1,15 +1,19 @@
 import csv
+import hashlib
+import json
 import requests
 from PIL import Image
 import io
 import numpy as np
-from collections import Counter
+from collections import Counter, deque
 from urllib.parse import urlparse
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import colorsys
 import urllib3
 
+from build_catalogue_store import normalize_type
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -51,34 +55,37 @@ def is_blue_color(rgb):
     
     return False
 
+def load_image_pixels(image_url):
+    """
+    下载图片并返回像素数组（N x 3，uint8）
+    """
+    # 下载图片（跳过SSL证书验证以支持britishmuseum.org等网站）
+    response = requests.get(image_url, timeout=15, verify=False)
+    response.raise_for_status()
+    
+    # 打开图片
+    image = Image.open(io.BytesIO(response.content))
+    
+    # 转换为RGB模式（如果不是的话）
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # 为了加快处理速度，如果图片太大则缩小（保持宽高比，最大边不超过800像素）
+    max_size = 800
+    if max(image.size) > max_size:
+        ratio = max_size / max(image.size)
+        new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    
+    # 将图片转换为numpy数组，获取所有像素的RGB值
+    return np.array(image).reshape(-1, 3)
+
 def extract_blue_colors_from_image(image_url):
     """
     从图片URL下载图片并提取蓝色相关的RGB颜色及其比例
     """
     try:
-        # 下载图片（跳过SSL证书验证以支持britishmuseum.org等网站）
-        response = requests.get(image_url, timeout=15, verify=False)
-        response.raise_for_status()
-        
-        # 打开图片
-        image = Image.open(io.BytesIO(response.content))
-        
-        # 转换为RGB模式（如果不是的话）
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 为了加快处理速度，如果图片太大则缩小（保持宽高比，最大边不超过800像素）
-        max_size = 800
-        if max(image.size) > max_size:
-            ratio = max_size / max(image.size)
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # 将图片转换为numpy数组
-        img_array = np.array(image)
-        
-        # 获取所有像素的RGB值
-        pixels = img_array.reshape(-1, 3)
+        pixels = load_image_pixels(image_url)
         
         # 过滤出蓝色像素
         blue_pixels = []
@@ -257,6 +264,405 @@ def process_csv(input_file, output_file, limit=None, max_workers=5):
         writer.writerows(results)
     
     print(f"\n完成！结果已保存到 {output_file}")
+    
+    write_gallery_shards(results)
+
+# ---------------------------------------------------------------------------
+# 颜色画廊分片：colors.html 按需加载固定大小的有序分片，并通过索引获取计数与类型分面
+# ---------------------------------------------------------------------------
+
+GALLERY_DIR = "gallery"
+GALLERY_SHARD_SIZE = 100
+
+def _id_sort_key(row):
+    """按数字 id 排序，非数字 id 排在最后"""
+    try:
+        return (0, int(row.get('id', '')))
+    except ValueError:
+        return (1, row.get('id', ''))
+
+def write_gallery_shards(rows, gallery_dir=GALLERY_DIR, shard_size=GALLERY_SHARD_SIZE):
+    """
+    将画廊数据（id, type, URL, rgb_color）按 id 排序后写为固定大小的分片，
+    并写入 index.json：总数、分片大小、类型分面以及每个分片内的 类型 x 颜色数 计数
+    页面根据这些计数即可定位过滤/排序后的第 N 条记录所在的分片，无需下载全部数据
+    """
+    os.makedirs(gallery_dir, exist_ok=True)
+    rows = sorted(rows, key=_id_sort_key)
+
+    # 清理旧分片，避免数据变少时残留多余文件
+    for name in os.listdir(gallery_dir):
+        if name.startswith('shard_') and name.endswith('.json'):
+            os.remove(os.path.join(gallery_dir, name))
+
+    shards = []
+    type_counts = Counter()
+    for number, start in enumerate(range(0, len(rows), shard_size)):
+        items = [
+            {
+                'id': row.get('id', ''),
+                # 与列式存储/查询服务使用同一套器型归一化（"bird feeder" -> "bird-feeder"）
+                'type': normalize_type(row.get('type', '')),
+                'URL': row.get('URL', ''),
+                'rgb_color': row.get('rgb_color', ''),
+            }
+            for row in rows[start:start + shard_size]
+        ]
+        file_name = f"shard_{number:05d}.json"
+        with open(os.path.join(gallery_dir, file_name), 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False, separators=(',', ':'))
+
+        # 分片内按 类型 -> 颜色数 -> 数量 统计，支持按类型过滤与按颜色数排序时的定位
+        type_colors = {}
+        for item in items:
+            color_count = str(item['rgb_color'].count('rgb('))
+            counts = type_colors.setdefault(item['type'], {})
+            counts[color_count] = counts.get(color_count, 0) + 1
+        type_counts.update(item['type'] for item in items if item['type'])
+        shards.append({
+            'file': file_name,
+            'count': len(items),
+            'type_colors': dict(sorted(type_colors.items())),
+        })
+
+    index = {
+        'total': len(rows),
+        'shard_size': shard_size,
+        'types': dict(type_counts.most_common()),
+        'shards': shards,
+    }
+    with open(os.path.join(gallery_dir, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+
+    print(f"画廊分片已写入 {gallery_dir}/（{len(shards)} 个分片，每片 {shard_size} 条）")
+
+def write_gallery_shards_from_csv(color_file, gallery_dir=GALLERY_DIR, shard_size=GALLERY_SHARD_SIZE):
+    """由已有的 color.csv 重新生成画廊分片（无需重新下载图片）"""
+    with open(color_file, 'r', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    write_gallery_shards(rows, gallery_dir=gallery_dir, shard_size=shard_size)
+
+# ---------------------------------------------------------------------------
+# 全馆参考色板模式：流式 mini-batch k-means（Lab 空间）+ 固定长度色板直方图
+# ---------------------------------------------------------------------------
+
+PALETTE_FILE = "palette.json"
+PALETTE_OUTPUT_FILE = "color_palette.csv"
+# 采样像素的磁盘缓存（训练与编码时读取，避免重复下载且内存有界）
+PALETTE_SAMPLE_DIR = os.path.join("data", "pixel_samples")
+
+def blue_pixel_mask(pixels):
+    """
+    向量化的蓝色像素判断（N x 3 -> N 布尔数组）
+    与 test_fixed_detection.py 中修复后的条件一致：不包含灰度分支，
+    避免 rgb(0, 0, 0)、rgb(160, 160, 160) 这类灰色被当作蓝色
+    """
+    rgb = pixels.astype(np.float64) / 255.0
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    v = rgb.max(axis=1)
+    c = v - rgb.min(axis=1)
+    s = np.divide(c, v, out=np.zeros_like(v), where=v > 0)
+    # B 为最大分量时 HSV 色相 = 240 + 60 * (r - g) / c
+    h = 240.0 + 60.0 * np.divide(r - g, c, out=np.zeros_like(c), where=c > 0)
+    is_blueish = (b > r) & (b > g)
+    return is_blueish & (h >= 200) & (h <= 260) & (s > 0.05) & (v > 0.15)
+
+def rgb_to_lab(pixels):
+    """sRGB（0-255）转换为 CIE Lab（D65 白点），输入 N x 3，输出 N x 3 float32"""
+    rgb = pixels.astype(np.float32) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    matrix = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ], dtype=np.float32)
+    xyz = linear @ matrix.T / np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = np.empty_like(f)
+    lab[:, 0] = 116.0 * f[:, 1] - 16.0
+    lab[:, 1] = 500.0 * (f[:, 0] - f[:, 1])
+    lab[:, 2] = 200.0 * (f[:, 1] - f[:, 2])
+    return lab
+
+def lab_to_rgb(lab):
+    """CIE Lab 转回 sRGB（0-255 整数），用于输出色板颜色"""
+    lab = np.asarray(lab, dtype=np.float64)
+    fy = (lab[:, 0] + 16.0) / 116.0
+    fx = fy + lab[:, 1] / 500.0
+    fz = fy - lab[:, 2] / 200.0
+    f = np.stack([fx, fy, fz], axis=1)
+    xyz = np.where(f ** 3 > 0.008856, f ** 3, (f - 16.0 / 116.0) / 7.787)
+    xyz *= np.array([0.95047, 1.0, 1.08883])
+    matrix = np.array([
+        [3.2404542, -1.5371385, -0.4985314],
+        [-0.9692660, 1.8760108, 0.0415560],
+        [0.0556434, -0.2040259, 1.0572252],
+    ])
+    linear = np.clip(xyz @ matrix.T, 0.0, 1.0)
+    rgb = np.where(linear > 0.0031308, 1.055 * linear ** (1 / 2.4) - 0.055, 12.92 * linear)
+    return np.rint(rgb * 255).astype(int)
+
+def sample_blue_pixels(image_url, max_samples=2000, seed=0):
+    """
+    下载图片并随机采样至多 max_samples 个蓝色像素（uint8，N x 3）
+    每张图片的样本量有上限，保证流式聚类时内存有界
+    """
+    pixels = load_image_pixels(image_url)
+    blue_pixels = pixels[blue_pixel_mask(pixels)]
+    if len(blue_pixels) > max_samples:
+        rng = np.random.default_rng(seed)
+        blue_pixels = blue_pixels[rng.choice(len(blue_pixels), max_samples, replace=False)]
+    return blue_pixels
+
+def nearest_centroid(lab, centroids):
+    """
+    最近质心分配：利用 |x - c|^2 = |x|^2 - 2 x·c + |c|^2 展开为一次矩阵乘法
+    （|x|^2 对 argmin 无影响，省略）
+    """
+    distances = (centroids ** 2).sum(axis=1) - 2.0 * lab @ centroids.T
+    return distances.argmin(axis=1)
+
+def init_centroids(lab, k, seed=0):
+    """k-means++ 初始化质心"""
+    rng = np.random.default_rng(seed)
+    centroids = [lab[rng.integers(len(lab))]]
+    closest = ((lab - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            index = rng.integers(len(lab))
+        else:
+            index = rng.choice(len(lab), p=closest / total)
+        centroids.append(lab[index])
+        closest = np.minimum(closest, ((lab - lab[index]) ** 2).sum(axis=1))
+    return np.array(centroids, dtype=np.float32)
+
+def minibatch_kmeans_update(centroids, counts, batch):
+    """
+    mini-batch k-means 单步更新（Sculley 2010）
+    每个质心的学习率为 1 / 累计分配样本数，原地更新 centroids 与 counts
+    """
+    labels = nearest_centroid(batch, centroids)
+    batch_counts = np.bincount(labels, minlength=len(centroids))
+    batch_sums = np.zeros_like(centroids)
+    np.add.at(batch_sums, labels, batch)
+    updated = batch_counts > 0
+    counts[updated] += batch_counts[updated]
+    rate = (batch_counts[updated] / counts[updated])[:, None]
+    batch_means = batch_sums[updated] / batch_counts[updated][:, None]
+    centroids[updated] = (1.0 - rate) * centroids[updated] + rate * batch_means
+
+def reassign_starved_centroids(centroids, counts, candidates, rng, ratio=0.01):
+    """
+    重新放置“饥饿”质心：累计样本数低于最大值 ratio 倍的质心，
+    按到现有质心距离平方的概率从候选样本中重新选点（k-means++ 方式）
+    计数重置为其余质心的最小值，避免刚放置就被再次判定为饥饿
+    返回被重新放置的质心个数
+    """
+    starved = counts < ratio * counts.max()
+    if not starved.any() or starved.all():
+        return 0
+    healthy = centroids[~starved]
+    distances = (candidates ** 2).sum(axis=1)[:, None] - 2.0 * candidates @ healthy.T \
+        + (healthy ** 2).sum(axis=1)
+    closest = np.maximum(distances.min(axis=1), 0.0)
+    total = closest.sum()
+    p = closest / total if total > 0 else None
+    picks = rng.choice(len(candidates), size=int(starved.sum()), replace=False, p=p)
+    centroids[starved] = candidates[picks]
+    counts[starved] = counts[~starved].min()
+    return len(picks)
+
+def reservoir_update(reservoir, seen, samples, rng):
+    """
+    蓄水池抽样（Algorithm R）的批量版本：把 samples 并入固定容量的 reservoir
+    seen 为此前已见过的样本总数，返回 (reservoir, seen)
+    所有器物的样本被选中的概率相同，与其在输入文件中的位置无关
+    """
+    capacity = len(reservoir)
+    filled = min(seen, capacity)
+    take = min(capacity - filled, len(samples))
+    reservoir[filled:filled + take] = samples[:take]
+    rest = samples[take:]
+    if len(rest):
+        # 第 i 个样本（从 0 计）以 capacity / (i + 1) 的概率替换池中随机位置
+        positions = np.arange(seen + take, seen + len(samples)) + 1
+        slots = (rng.random(len(rest)) * positions).astype(np.int64)
+        keep = slots < capacity
+        reservoir[slots[keep]] = rest[keep]
+    return reservoir, seen + len(samples)
+
+def palette_histogram(lab, centroids):
+    """将像素编码为色板上的归一化直方图（长度 = 色板颜色数）"""
+    if len(lab) == 0:
+        return np.zeros(len(centroids), dtype=np.float32)
+    counts = np.bincount(nearest_centroid(lab, centroids), minlength=len(centroids))
+    return (counts / counts.sum()).astype(np.float32)
+
+def format_histogram_string(histogram):
+    """将直方图格式化为字符串，格式：0.12; 0.00; 0.31 ..."""
+    return "; ".join(f"{value:.2f}" for value in histogram)
+
+def sample_cache_file(row, max_samples, sample_dir=PALETTE_SAMPLE_DIR):
+    """
+    采样缓存文件路径：由 id、URL 哈希与采样上限共同决定，
+    输入文件重排、图片更换或修改 max_samples 后都不会误用旧样本
+    """
+    url_hash = hashlib.sha1(row.get('URL', '').encode('utf-8')).hexdigest()[:12]
+    return os.path.join(sample_dir, f"{row.get('id', '')}_{url_hash}_{max_samples}.npy")
+
+def sample_single_image(task):
+    """
+    采样单张图片的蓝色像素并写入缓存，用于多线程
+    只返回 (id, 缓存路径)，样本由主线程按需读取，避免结果对象长期占用内存
+    """
+    row, max_samples, sample_dir = task
+    url = row.get('URL', '')
+    cache_file = sample_cache_file(row, max_samples, sample_dir)
+
+    if os.path.exists(cache_file):
+        return row.get('id', ''), cache_file
+    if not url:
+        return row.get('id', ''), None
+
+    try:
+        # 随机种子取自缓存键，同一件器物每次采样结果相同
+        seed = int(os.path.basename(cache_file).split('_')[1], 16)
+        samples = sample_blue_pixels(url, max_samples=max_samples, seed=seed)
+    except Exception as e:
+        print(f"处理图片 {url} 时出错: {str(e)}")
+        return row.get('id', ''), None
+
+    np.save(cache_file, samples)
+    return row.get('id', ''), cache_file
+
+def _read_rows(input_file, limit=None):
+    """逐行读取 CSV（生成器），limit 指定时只读取前 limit 行"""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for count, row in enumerate(csv.DictReader(f)):
+            if limit and count >= limit:
+                break
+            yield row
+
+def build_collection_palette(input_file, palette_file, output_file, limit=None,
+                             n_colors=16, batch_size=4096, max_samples=2000,
+                             max_workers=5, sample_dir=PALETTE_SAMPLE_DIR,
+                             n_epochs=2, seed_samples=50000, mix_objects=32, seed=0):
+    """
+    学习全馆共享的青花色板，并将每件器物编码为固定长度的色板直方图
+    第一遍：流式下载采样并写入缓存，同时对全部蓝色像素做蓄水池抽样
+    初始化：在蓄水池样本上做 k-means++，初始质心覆盖全馆而不只是文件开头的几件器物
+    训练：共 n_epochs 轮，每轮打乱器物顺序，每 mix_objects 件器物的像素混合打乱后
+          切成 batch_size 大小的 mini-batch 更新；长期分不到样本的质心从蓄水池中重新放置
+    最后一遍：从采样缓存读取各器物像素，按最近质心统计直方图
+    同时进行中的下载任务不超过 2 x max_workers 个；除每件器物一个缓存路径外，
+    内存占用只与 seed_samples、mix_objects、max_samples 和线程数有关；
+    随机数均由 seed 派生，相同输入下色板结果可复现
+    """
+    os.makedirs(sample_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    if limit:
+        print(f"测试模式：只处理前 {limit} 行")
+    total_rows = sum(1 for _ in _read_rows(input_file, limit))
+    print(f"第一遍：采样蓝色像素（{total_rows} 行，{max_workers} 个线程）\n")
+
+    reservoir = np.empty((seed_samples, 3), dtype=np.float32)
+    seen = 0
+    cache_files = []
+
+    def consume(completed_count, future):
+        nonlocal reservoir, seen
+        item_id, cache_file = future.result()
+        lab = rgb_to_lab(np.load(cache_file)) if cache_file else None
+        if lab is None or len(lab) == 0:
+            print(f"[{completed_count}/{total_rows}] ID {item_id} 没有蓝色样本")
+            return
+
+        cache_files.append(cache_file)
+        reservoir, seen = reservoir_update(reservoir, seen, lab, rng)
+        print(f"[{completed_count}/{total_rows}] ID {item_id} 采样 {len(lab)} 个蓝色像素")
+
+    # 有界提交窗口：按提交顺序取回结果，已取回的 Future 立即丢弃
+    window = deque()
+    completed_count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for row in _read_rows(input_file, limit):
+            window.append(executor.submit(sample_single_image, (row, max_samples, sample_dir)))
+            if len(window) >= 2 * max_workers:
+                completed_count += 1
+                consume(completed_count, window.popleft())
+        while window:
+            completed_count += 1
+            consume(completed_count, window.popleft())
+
+    reservoir = reservoir[:min(seen, seed_samples)]
+    if len(reservoir) < n_colors:
+        print("蓝色样本不足，无法生成色板")
+        return
+
+    print(f"\n训练色板：{n_colors} 种颜色，{len(cache_files)} 件器物，{n_epochs} 轮")
+    centroids = init_centroids(reservoir, n_colors, seed=seed)
+    counts = np.zeros(n_colors, dtype=np.float64)
+
+    for epoch in range(n_epochs):
+        order = rng.permutation(len(cache_files))
+        reassigned = 0
+        for start in range(0, len(order), mix_objects):
+            # 多件器物的像素混合打乱，每个 mini-batch 都来自不同器物
+            mixed = np.concatenate([
+                rgb_to_lab(np.load(cache_files[index])) for index in order[start:start + mix_objects]
+            ])
+            mixed = mixed[rng.permutation(len(mixed))]
+            for offset in range(0, len(mixed), batch_size):
+                minibatch_kmeans_update(centroids, counts, mixed[offset:offset + batch_size])
+            # 最后一轮不再重新放置，保证输出的质心都经过训练
+            if epoch < n_epochs - 1:
+                reassigned += reassign_starved_centroids(centroids, counts, reservoir, rng)
+        if reassigned:
+            print(f"第 {epoch + 1} 轮：重新放置 {reassigned} 个饥饿质心")
+
+    # 色板按亮度从深到浅排序，便于阅读和对比
+    order = np.argsort(centroids[:, 0])
+    centroids = centroids[order]
+    counts = counts[order]
+    palette_rgb = lab_to_rgb(centroids)
+
+    palette = {
+        'color_space': 'CIELAB (D65)',
+        'colors': [
+            {
+                'rgb': f"rgb({r}, {g}, {b})",
+                'lab': [round(float(v), 2) for v in lab],
+                'weight': round(float(n / counts.sum()), 4),
+            }
+            for (r, g, b), lab, n in zip(palette_rgb, centroids, counts)
+        ],
+    }
+    with open(palette_file, 'w', encoding='utf-8') as f:
+        json.dump(palette, f, ensure_ascii=False, indent=2)
+    print(f"\n色板已保存到 {palette_file}")
+
+    print("最后一遍：编码各器物的色板直方图")
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        fieldnames = ['id', 'type', 'URL', 'palette_histogram']
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in _read_rows(input_file, limit):
+            cache_file = sample_cache_file(row, max_samples, sample_dir)
+            histogram = ''
+            if os.path.exists(cache_file):
+                samples = np.load(cache_file)
+                if len(samples):
+                    histogram = format_histogram_string(palette_histogram(rgb_to_lab(samples), centroids))
+            writer.writerow({
+                'id': row.get('id', ''),
+                'type': row.get('type', ''),
+                'URL': row.get('URL', ''),
+                'palette_histogram': histogram,
+            })
+
+    print(f"\n完成！色板直方图已保存到 {output_file}")
 
 if __name__ == "__main__":
     import sys
@@ -264,14 +670,26 @@ if __name__ == "__main__":
     input_file = "Processed_Data.csv"
     output_file = "color.csv"
     
+    # --palette：学习全馆参考色板并输出色板直方图
+    # --shards：仅由已有的 color.csv 重新生成画廊分片
+    args = sys.argv[1:]
+    palette_mode = '--palette' in args
+    shards_mode = '--shards' in args
+    args = [arg for arg in args if arg not in ('--palette', '--shards')]
+    
     # 如果提供了命令行参数，使用测试模式（只处理前N行）
     limit = None
-    if len(sys.argv) > 1:
+    if args:
         try:
-            limit = int(sys.argv[1])
+            limit = int(args[0])
             print(f"使用测试模式，只处理前 {limit} 行\n")
         except ValueError:
             print("无效的参数，将处理所有数据\n")
     
-    process_csv(input_file, output_file, limit=limit)
+    if shards_mode:
+        write_gallery_shards_from_csv(output_file)
+    elif palette_mode:
+        build_collection_palette(input_file, PALETTE_FILE, PALETTE_OUTPUT_FILE, limit=limit)
+    else:
+        process_csv(input_file, output_file, limit=limit)
 
@@ -0,0 +1,437 @@
+import bisect
+import csv
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from build_catalogue_store import (
+    CATEGORY_COLUMNS, MET_FILE, MISSING_ID, MISSING_YEAR, NUMERIC_COLUMNS, PROCESSED_FILE,
+    STORE_DIR, STORE_VERSION, TEXT_COLUMNS, CatalogueStore, load_merged_records,
+)
+
+# 项目根目录（网站静态文件与数据文件所在位置）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLOR_FILE = "color.csv"
+# 可选：extract_blue_colors.py --palette 生成的色板直方图
+PALETTE_OUTPUT_FILE = "color_palette.csv"
+
+# 类别列：直接使用列式存储中的整数编码，建立 标签 -> 行号 的倒排索引，并支持分面计数
+CATEGORY_FIELDS = ['period', 'type']
+# 可排序列：加载时预先计算升序/降序的行顺序
+SORT_FIELDS = ['id', 'height_cm', 'diameter_cm', 'year_start', 'color_count']
+# 参与全文搜索的列
+SEARCH_FIELDS = ['id', 'date', 'period', 'type', 'element', 'object_number', 'URL']
+# 返回给页面的字段
+RESULT_FIELDS = [
+    'id', 'date', 'period', 'type', 'element', 'object_number', 'URL',
+    'rgb_color', 'color_count', 'height_cm', 'diameter_cm', 'year_start', 'year_end',
+    'palette_histogram',
+]
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+CACHE_SIZE = 1024
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text):
+    """将文本切分为小写字母数字词元"""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _read_csv_by_id(file_path):
+    """读取以 id 为键的 CSV，文件不存在时返回空字典"""
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return {row.get('id', ''): row for row in csv.DictReader(f)}
+
+
+def load_store(root=PROJECT_ROOT):
+    """
+    加载 build_catalogue_store.py 生成的列式存储（内存映射）
+    存储不存在、早于源 CSV、由旧版解析规则生成（版本号不符）或缺少列时，
+    直接由两份导出在内存中重建
+    """
+    store_dir = os.path.join(root, STORE_DIR)
+    meta_file = os.path.join(store_dir, 'meta.json')
+    sources = [os.path.join(root, PROCESSED_FILE), os.path.join(root, MET_FILE)]
+
+    if os.path.exists(meta_file) and os.path.getmtime(meta_file) >= max(map(os.path.getmtime, sources)):
+        store = CatalogueStore.load(store_dir)
+        required = set(NUMERIC_COLUMNS) | set(TEXT_COLUMNS) | set(CATEGORY_COLUMNS)
+        if store.version != STORE_VERSION:
+            print(f"{store_dir} 版本 {store.version} 与当前解析规则（版本 {STORE_VERSION}）不符，重新解析源数据")
+        elif not required <= set(store.columns):
+            print(f"{store_dir} 缺少列，重新解析源数据")
+        else:
+            return store
+    else:
+        print(f"{store_dir} 不存在或已过期，重新解析源数据（可运行 scripts/build_catalogue_store.py 预先生成）")
+
+    return CatalogueStore.from_records(load_merged_records(*sources))
+
+
+def load_index(root=PROJECT_ROOT):
+    """加载列式存储并按 id 关联 color.csv 与色板直方图，建立查询索引"""
+    return CatalogueIndex(
+        load_store(root),
+        _read_csv_by_id(os.path.join(root, COLOR_FILE)),
+        _read_csv_by_id(os.path.join(root, PALETTE_OUTPUT_FILE)),
+    )
+
+
+class CatalogueIndex:
+    """
+    基于 CatalogueStore 的查询索引
+    - 只索引有 id 的记录（即 Processed_Data.csv 来源）：color.csv 与网站静态数据都以它的 id 为准，
+      Met 导出的记录在存储中 id 为 MISSING_ID，无法关联颜色数据
+    - 类型化列与类别编码直接取自存储，只额外关联颜色与色板直方图列
+    - 类别列：标签 -> 行号倒排索引
+    - 排序列：预先计算的升序/降序行顺序（缺失值始终排在最后）
+    - 搜索：有序词表 + 倒排表，按词元前缀匹配，多个词取交集
+    """
+
+    def __init__(self, store, colors, palettes):
+        rows = np.nonzero(store['id'] != MISSING_ID)[0]
+        self.size = len(rows)
+
+        self.columns = {
+            'id': np.asarray(store['id'][rows], dtype=np.int64),
+            'year_start': np.asarray(store['year_start'][rows], dtype=np.int64),
+            'year_end': np.asarray(store['year_end'][rows], dtype=np.int64),
+            'height_cm': np.asarray(store['height_cm'][rows], dtype=np.float64),
+            'diameter_cm': np.asarray(store['diameter_cm'][rows], dtype=np.float64),
+            'date': store['date'][rows],
+            'element': store['element'][rows],
+            'object_number': store['object_number'][rows],
+            'URL': store['url'][rows],
+        }
+
+        ids = [str(item_id) for item_id in self.columns['id']]
+        rgb_colors = [colors.get(item_id, {}).get('rgb_color', '') for item_id in ids]
+        self.columns['rgb_color'] = np.array(rgb_colors, dtype=object)
+        self.columns['color_count'] = np.array([c.count('rgb(') for c in rgb_colors], dtype=np.int64)
+        self.columns['palette_histogram'] = np.array(
+            [palettes.get(item_id, {}).get('palette_histogram', '') for item_id in ids], dtype=object)
+
+        self.categories = {field: store.categories[field] for field in CATEGORY_FIELDS}
+        self.codes = {field: np.asarray(store[field][rows], dtype=np.int64) for field in CATEGORY_FIELDS}
+
+        self._build_category_indexes()
+        self._build_sort_indexes()
+        self._build_search_index()
+        # 子串搜索用的小写文本列，首次按列搜索时生成
+        self.search_text = {}
+
+    def _build_category_indexes(self):
+        self.postings = {}
+        for field in CATEGORY_FIELDS:
+            codes = self.codes[field]
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(self.categories[field]) + 1))
+            self.postings[field] = {
+                label: order[bounds[code]:bounds[code + 1]]
+                for code, label in enumerate(self.categories[field])
+            }
+
+    def value(self, field, row):
+        """取单元格的值（类别列返回标签）"""
+        if field in self.codes:
+            return self.categories[field][self.codes[field][row]]
+        return self.columns[field][row]
+
+    def _build_sort_indexes(self):
+        self.sort_orders = {}
+        for field in SORT_FIELDS:
+            values = self.columns[field].astype(np.float64)
+            missing = np.isnan(values)
+            if field == 'year_start':
+                missing |= values == MISSING_YEAR
+            valid_rows = np.nonzero(~missing)[0]
+            missing_rows = np.nonzero(missing)[0]
+            ascending = valid_rows[np.argsort(values[valid_rows], kind='stable')]
+            # 降序时相同值保持原有（升序 id）顺序
+            descending = valid_rows[np.argsort(-values[valid_rows], kind='stable')]
+            self.sort_orders[field] = {
+                'asc': np.concatenate([ascending, missing_rows]),
+                'desc': np.concatenate([descending, missing_rows]),
+            }
+
+    def _build_search_index(self):
+        token_rows = {}
+        for row in range(self.size):
+            tokens = set()
+            for field in SEARCH_FIELDS:
+                tokens.update(tokenize(str(self.value(field, row))))
+            for token in tokens:
+                token_rows.setdefault(token, []).append(row)
+        # 倒排表按词表顺序拼接为一个数组，前缀匹配的连续词元对应一段连续切片
+        self.tokens = sorted(token_rows)
+        lengths = [len(token_rows[t]) for t in self.tokens]
+        self.token_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.token_postings = np.array(
+            [row for t in self.tokens for row in token_rows[t]], dtype=np.int64)
+
+    def search_mask(self, query):
+        """返回匹配搜索词的行掩码：每个词按前缀匹配，多个词之间取交集"""
+        mask = np.ones(self.size, dtype=bool)
+        for term in tokenize(query):
+            start = bisect.bisect_left(self.tokens, term)
+            end = bisect.bisect_left(self.tokens, term + '\uffff')
+            term_mask = np.zeros(self.size, dtype=bool)
+            term_mask[self.token_postings[self.token_offsets[start]:self.token_offsets[end]]] = True
+            mask &= term_mask
+        return mask
+
+    def substring_mask(self, query, fields):
+        """
+        返回任一指定列包含搜索词（整串、不区分大小写）的行掩码，
+        与页面回退到静态数据时的本地搜索规则一致
+        """
+        term = query.lower()
+        mask = np.zeros(self.size, dtype=bool)
+        for field in fields:
+            if field not in self.search_text:
+                self.search_text[field] = np.array(
+                    [str(self.value(field, row)).lower() for row in range(self.size)])
+            mask |= np.char.find(self.search_text[field], term) >= 0
+        return mask
+
+    def filter_mask(self, params):
+        """根据查询参数构建行掩码"""
+        mask = np.ones(self.size, dtype=bool)
+
+        for field in CATEGORY_FIELDS:
+            label = params.get(field)
+            if label:
+                rows = self.postings[field].get(label)
+                field_mask = np.zeros(self.size, dtype=bool)
+                if rows is not None:
+                    field_mask[rows] = True
+                mask &= field_mask
+
+        year_from = _to_number(params.get('year_from'))
+        year_to = _to_number(params.get('year_to'))
+        if year_from is not None or year_to is not None:
+            mask &= self.columns['year_start'] != MISSING_YEAR
+            if year_from is not None:
+                mask &= self.columns['year_end'] >= year_from
+            if year_to is not None:
+                mask &= self.columns['year_start'] <= year_to
+
+        for field, key, compare in (
+            ('height_cm', 'min_height', np.greater_equal),
+            ('height_cm', 'max_height', np.less_equal),
+            ('color_count', 'min_colors', np.greater_equal),
+        ):
+            value = _to_number(params.get(key))
+            if value is not None:
+                mask &= compare(self.columns[field], value)
+
+        if params.get('q'):
+            if params.get('search_fields'):
+                fields = params['search_fields'].split(',')
+                unknown = [field for field in fields if field not in SEARCH_FIELDS]
+                if unknown:
+                    raise ValueError(f"不支持的搜索字段: {', '.join(unknown)}")
+                mask &= self.substring_mask(params['q'], fields)
+            else:
+                mask &= self.search_mask(params['q'])
+
+        return mask
+
+    def query(self, params):
+        """分页查询：过滤、搜索、排序后返回指定页"""
+        mask = self.filter_mask(params)
+
+        sort_field = params.get('sort') or 'id'
+        if sort_field not in self.sort_orders:
+            raise ValueError(f"不支持的排序字段: {sort_field}")
+        direction = 'desc' if params.get('order') == 'desc' else 'asc'
+        order = self.sort_orders[sort_field][direction]
+        rows = order[mask[order]]
+
+        page_size = int(_to_number(params.get('page_size')) or DEFAULT_PAGE_SIZE)
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        total = len(rows)
+        pages = max(1, -(-total // page_size))
+        page = int(_to_number(params.get('page')) or 1)
+        page = max(1, min(page, pages))
+        page_rows = rows[(page - 1) * page_size:page * page_size]
+
+        return {
+            'total': total,
+            'page': page,
+            'pages': pages,
+            'page_size': page_size,
+            'items': [self.record(row) for row in page_rows],
+        }
+
+    def facets(self, params, fields=None):
+        """分面计数：在当前过滤条件下统计各类别取值的数量（按数量降序）"""
+        mask = self.filter_mask(params)
+        result = {}
+        for field in fields or CATEGORY_FIELDS:
+            if field not in self.codes:
+                raise ValueError(f"不支持的分面字段: {field}")
+            counts = np.bincount(self.codes[field][mask], minlength=len(self.categories[field]))
+            order = np.argsort(-counts, kind='stable')
+            result[field] = {
+                self.categories[field][code]: int(counts[code])
+                for code in order
+                if counts[code] > 0 and self.categories[field][code]
+            }
+        return {'total': int(mask.sum()), 'facets': result}
+
+    def record(self, row):
+        """将一行转换为可 JSON 序列化的字典"""
+        item = {}
+        for field in RESULT_FIELDS:
+            value = self.value(field, row)
+            if isinstance(value, np.floating):
+                value = None if np.isnan(value) else round(float(value), 2)
+            elif isinstance(value, np.integer):
+                value = int(value)
+            elif isinstance(value, np.str_):
+                value = str(value)
+            item[field] = value
+        return item
+
+
+def _to_number(value):
+    """
+    查询参数转换为数字，空值返回 None
+    非数字或非有限值（inf、nan、1e400）抛出 ValueError，由接口返回 400
+    """
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"参数不是数字: {value}")
+    if not math.isfinite(number):
+        raise ValueError(f"参数必须是有限数字: {value}")
+    return number
+
+
+class ResponseCache:
+    """线程安全的 LRU 响应缓存（键为规范化后的路径与查询参数）"""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class QueryHandler(SimpleHTTPRequestHandler):
+    """
+    同时提供网站静态文件与 /api 查询接口（页面以相对路径 /api 访问，只走同源请求，
+    不发送 CORS 头，其他网站无法跨域读取项目目录中的文件）：
+    - GET /api/health   服务状态与记录数
+    - GET /api/objects  分页过滤/排序/搜索（q, search_fields, period, type, year_from, year_to,
+                        min_height, max_height, min_colors, sort, order, page, page_size）
+                        q 默认按词元前缀匹配 SEARCH_FIELDS；给出 search_fields（逗号分隔）时
+                        改为在这些列中做子串匹配，页面据此与静态回退保持相同的搜索结果
+    - GET /api/facets   分面计数（fields=period,type，其余参数同 /api/objects）
+    """
+
+    index = None
+    cache = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.startswith('/api/'):
+            return super().do_GET()
+
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        cache_key = (parsed.path, tuple(sorted(params.items())))
+        body = self.cache.get(cache_key)
+
+        if body is None:
+            try:
+                payload = self.handle_api(parsed.path, params)
+            except ValueError as e:
+                return self.send_json({'error': str(e)}, status=400)
+            if payload is None:
+                return self.send_json({'error': f"未知接口: {parsed.path}"}, status=404)
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.cache.put(cache_key, body)
+
+        self.send_json_body(body)
+
+    def handle_api(self, path, params):
+        if path == '/api/health':
+            return {'status': 'ok', 'rows': self.index.size}
+        if path == '/api/objects':
+            return self.index.query(params)
+        if path == '/api/facets':
+            fields = [f for f in params.pop('fields', '').split(',') if f] or None
+            return self.index.facets(params, fields)
+        return None
+
+    def send_json(self, payload, status=200):
+        self.send_json_body(json.dumps(payload, ensure_ascii=False).encode('utf-8'), status)
+
+    def send_json_body(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run_server(port=8000, root=PROJECT_ROOT):
+    """加载数据、建立索引并启动服务"""
+    start = time.perf_counter()
+    QueryHandler.index = load_index(root)
+    QueryHandler.cache = ResponseCache()
+    print(f"已索引 {QueryHandler.index.size} 条记录，用时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    handler = partial(QueryHandler, directory=root)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f"服务已启动：http://localhost:{port}/index.html（接口前缀 /api）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = 8000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[1])
+        except ValueError:
+            print("无效的端口参数，使用默认端口 8000\n")
+
+    run_server(port=port)